@@ -1,21 +1,40 @@
 from __future__ import annotations
 
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data.db")
 
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+# Sync driver names in DATABASE_URL are mapped onto the asyncio drivers the app runs on.
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "sqlite+aiosqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgresql+psycopg": "postgresql+asyncpg",
+    "postgresql+asyncpg": "postgresql+asyncpg",
+}
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def _async_url(url: str) -> URL:
+    parsed = make_url(url)
+    drivername = ASYNC_DRIVERS.get(parsed.drivername)
+    if drivername is None:
+        raise ValueError(
+            f"Unsupported DATABASE_URL scheme '{parsed.drivername}'; "
+            f"expected one of: {', '.join(ASYNC_DRIVERS)}"
+        )
+    return parsed.set(drivername=drivername)
+
+
+engine = create_async_engine(_async_url(DATABASE_URL))
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
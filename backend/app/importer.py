@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import zipfile
+from collections import Counter
 from dataclasses import dataclass
-from typing import Iterable, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
-import pandas as pd
+import openpyxl
+from openpyxl.utils.exceptions import InvalidFileException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from . import models, serials
 
@@ -16,6 +22,7 @@ EXPECTED_COLUMNS = {
     "sold",
     "quantity",
 }
+COLUMN_ORDER = ("foreign_key", "item_desc", "location", "stocked", "sold", "quantity")
 
 
 @dataclass
@@ -30,6 +37,7 @@ class ImportRow:
     sold: int
     quantity: int
     errors: List[str]
+    record: Optional[dict] = None
 
 
 @dataclass
@@ -37,39 +45,76 @@ class ImportResult:
     dry_run: bool
     imported: int
     failed: int
-    rows: List[ImportRow]
 
 
-def _normalize_bool(value) -> bool:
-    if isinstance(value, bool):
-        return value
+@dataclass
+class ImportLookups:
+    paintings: Dict[str, models.Painting]
+    variants: Dict[str, Dict[str, models.ProductVariant]]
+    locations: Dict[str, models.Location]
+    existing_serials: Set[str]
+    painting_serial_counts: Counter
+
+
+def _normalize_header(column) -> str:
+    return str(column).strip().lower().replace(" ", "_")
+
+
+def _coerce_text(value) -> str:
     if value is None:
-        return False
-    text = str(value).strip().lower()
-    return text in {"1", "true", "yes", "y", "t"}
+        return ""
+    return str(value).strip()
 
 
-def _normalize_float(value) -> float:
+def _coerce_int(value) -> int:
+    if isinstance(value, int):
+        return int(value)
     try:
-        return float(value)
-    except (TypeError, ValueError):
-        return 0.0
+        return int(float(value))
+    except (TypeError, ValueError, OverflowError):
+        return 0
 
 
-def _normalize_int(value) -> int:
+def _iter_inventory_rows(upload) -> Iterator[Tuple[int, str, str, str, int, int, int]]:
     try:
-        return int(value)
-    except (TypeError, ValueError):
-        return 0
+        workbook = openpyxl.load_workbook(upload, read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile, KeyError) as exc:
+        raise ValueError("Upload is not a valid Excel workbook") from exc
+    if "Inventory" not in workbook.sheetnames:
+        workbook.close()
+        raise ValueError("Worksheet 'Inventory' not found in workbook")
+
+    sheet_rows = workbook["Inventory"].iter_rows(values_only=True)
+    positions = {}
+    for position, column in enumerate(next(sheet_rows, ())):
+        positions.setdefault(_normalize_header(column), position)
+    missing = _validate_columns(positions)
+    if missing:
+        workbook.close()
+        raise ValueError(f"Missing required columns: {', '.join(sorted(missing))}")
+
+    return _read_inventory_rows(workbook, sheet_rows, [positions[col] for col in COLUMN_ORDER])
 
 
-def _load_dataframe(upload) -> pd.DataFrame:
+def _read_inventory_rows(workbook, sheet_rows, positions: List[int]):
     try:
-        df = pd.read_excel(upload, sheet_name="Inventory")
-    except ValueError as exc:
-        raise ValueError("Worksheet 'Inventory' not found in workbook") from exc
-    df.columns = [str(col).strip().lower().replace(" ", "_") for col in df.columns]
-    return df
+        # start at 2 to account for the header row in spreadsheets
+        for row_number, values in enumerate(sheet_rows, start=2):
+            cells = [values[pos] if pos < len(values) else None for pos in positions]
+            if all(cell is None for cell in cells):
+                continue
+            serial_cell, desc_cell, location_cell, stocked_cell, sold_cell, quantity_cell = cells
+            yield (
+                row_number,
+                _coerce_text(serial_cell).upper(),
+                _coerce_text(desc_cell),
+                _coerce_text(location_cell).upper(),
+                _coerce_int(stocked_cell),
+                _coerce_int(sold_cell),
+                _coerce_int(quantity_cell),
+            )
+    finally:
+        workbook.close()
 
 
 def _validate_columns(columns: Iterable[str]) -> List[str]:
@@ -77,39 +122,63 @@ def _validate_columns(columns: Iterable[str]) -> List[str]:
     return missing
 
 
-def process_inventory_upload(upload, db, dry_run: bool) -> ImportResult:
-    df = _load_dataframe(upload)
-    missing = _validate_columns(df.columns)
-    if missing:
-        raise ValueError(f"Missing required columns: {', '.join(sorted(missing))}")
-
-    rows: List[ImportRow] = []
+async def load_import_lookups(db: AsyncSession) -> ImportLookups:
+    painting_rows = await db.scalars(select(models.Painting).options(selectinload(models.Painting.variants)))
+    location_rows = await db.scalars(select(models.Location))
+    serial_rows = await db.scalars(select(models.InventoryItem.serial_number))
+
+    paintings = {painting.code.upper(): painting for painting in painting_rows}
+    variants = {
+        code: {variant.short_code: variant for variant in painting.variants}
+        for code, painting in paintings.items()
+    }
+    locations = {location.code.upper(): location for location in location_rows}
+    existing_serials = set(serial_rows)
+    painting_serial_counts = Counter(
+        serial.split("-", 2)[1].upper()
+        for serial in existing_serials
+        if serial.upper().startswith("PTG-") and serial.count("-") >= 2
+    )
+    return ImportLookups(paintings, variants, locations, existing_serials, painting_serial_counts)
+
+
+def process_inventory_upload(
+    upload, lookups: ImportLookups, dry_run: bool
+) -> Iterator[Union[ImportRow, ImportResult]]:
+    # The workbook is opened and its header validated here so a bad upload raises before anything is
+    # yielded. Rows follow one at a time; accepted rows carry their insert payload in ImportRow.record
+    # unless dry_run, and the ImportResult with the final counts is always the last item.
+    inventory_rows = _iter_inventory_rows(upload)
+    return _process_inventory_rows(inventory_rows, lookups, dry_run)
+
+
+def _process_inventory_rows(
+    inventory_rows, lookups: ImportLookups, dry_run: bool
+) -> Iterator[Union[ImportRow, ImportResult]]:
+    paintings = lookups.paintings
+    locations = lookups.locations
+    existing_serials = lookups.existing_serials
+    painting_serial_counts = lookups.painting_serial_counts
     imported = 0
     failed = 0
 
-    for idx, row in df.iterrows():
+    for row_number, serial_raw, item_desc, provided_location_code, stocked, sold, quantity in inventory_rows:
         errors: List[str] = []
-        serial_raw = str(row.get("foreign_key", "")).strip()
-        item_desc = str(row.get("item_desc", "")).strip()
         painting_code: Optional[str] = None
         variant_code: Optional[str] = None
         location_code: Optional[str] = None
-        stocked = _normalize_int(row.get("stocked"))
-        sold = _normalize_int(row.get("sold"))
-        quantity = _normalize_int(row.get("quantity"))
+        parsed: Optional[serials.SerialComponents] = None
         if quantity == 0 and (stocked or sold):
             quantity = max(stocked - sold, 0)
 
-        provided_location_code = str(row.get("location", "")).strip().upper()
-
         if not serial_raw:
             errors.append("Serial number is required")
         else:
             try:
-                components = serials.parse_serial_number(serial_raw)
-                painting_code = components.painting_code
-                variant_code = components.variant_code
-                location_code = components.location_code
+                parsed = serials.parse_serial_number(serial_raw)
+                painting_code = parsed.painting_code
+                variant_code = parsed.variant_code
+                location_code = parsed.location_code
             except ValueError as exc:
                 errors.append(str(exc))
 
@@ -120,22 +189,13 @@ def process_inventory_upload(upload, db, dry_run: bool) -> ImportResult:
 
         painting = None
         if painting_code:
-            painting = db.query(models.Painting).filter_by(code=painting_code).first()
+            painting = paintings.get(painting_code)
             if not painting:
                 errors.append(f"Painting code '{painting_code}' not found")
 
         variant = None
         if painting and variant_code:
-            for candidate in painting.variants:
-                short_code = serials.build_variant_code(
-                    candidate.category,
-                    candidate.size,
-                    candidate.stretch,
-                    candidate.framing,
-                )
-                if short_code == variant_code:
-                    variant = candidate
-                    break
+            variant = lookups.variants[painting_code].get(variant_code)
             if not variant:
                 errors.append(
                     f"Variant code '{variant_code}' not mapped to painting '{painting_code}'"
@@ -143,47 +203,35 @@ def process_inventory_upload(upload, db, dry_run: bool) -> ImportResult:
 
         location = None
         if location_code:
-            location = db.query(models.Location).filter_by(code=location_code).first()
+            location = locations.get(location_code)
             if not location:
                 errors.append(f"Location code '{location_code}' not found")
 
         inventory_serial = serial_raw
-        if painting and variant and location and not errors:
+        if parsed and painting and variant and location and not errors:
             expected_components = serials.SerialComponents(
                 painting_code=painting.code.upper(),
-                variant_code=serials.build_variant_code(
-                    variant.category, variant.size, variant.stretch, variant.framing
-                ),
+                variant_code=variant.short_code,
                 location_code=location.code.upper(),
-                sequence=serials.parse_serial_number(serial_raw).sequence,
+                sequence=parsed.sequence,
             )
             try:
                 serials.validate_serial_against_components(serial_raw, expected_components)
             except ValueError as exc:
                 errors.append(str(exc))
             else:
-                parsed = serials.parse_serial_number(serial_raw)
-                existing_count = (
-                    db.query(models.InventoryItem)
-                    .filter(models.InventoryItem.serial_number.like(f"PTG-{painting.code.upper()}-%"))
-                    .count()
-                )
+                existing_count = painting_serial_counts[painting.code.upper()]
                 if parsed.sequence == "0000":
                     sequence = serials.next_sequence_number(existing_count)
                     inventory_serial = expected_components.serial_number.replace(
                         parsed.sequence, sequence
                     )
 
-                duplicate = (
-                    db.query(models.InventoryItem)
-                    .filter_by(serial_number=inventory_serial)
-                    .first()
-                )
-                if duplicate:
+                if inventory_serial in existing_serials:
                     errors.append("Serial number already exists in inventory")
 
         import_row = ImportRow(
-            row_number=idx + 2,  # account for header row in spreadsheets
+            row_number=row_number,
             serial_number=inventory_serial,
             item_desc=item_desc,
             painting_code=painting_code,
@@ -194,32 +242,24 @@ def process_inventory_upload(upload, db, dry_run: bool) -> ImportResult:
             quantity=quantity,
             errors=errors,
         )
-        rows.append(import_row)
 
         if not errors and painting and variant and location:
-            if dry_run:
-                imported += 1
-            else:
-                record = models.InventoryItem(
-                    painting_id=painting.id,
-                    variant_id=variant.id,
-                    location_id=location.id,
-                    serial_number=inventory_serial,
-                    quantity=quantity,
-                    unit_cost=0.0,
-                    unit_price=0.0,
-                )
-                db.add(record)
-                imported += 1
+            existing_serials.add(inventory_serial)
+            painting_serial_counts[painting.code.upper()] += 1
+            imported += 1
+            if not dry_run:
+                import_row.record = {
+                    "painting_id": painting.id,
+                    "variant_id": variant.id,
+                    "location_id": location.id,
+                    "serial_number": inventory_serial,
+                    "quantity": quantity,
+                    "unit_cost": 0.0,
+                    "unit_price": 0.0,
+                }
         elif errors:
             failed += 1
 
-    if not dry_run:
-        db.commit()
+        yield import_row
 
-    return ImportResult(
-        dry_run=dry_run,
-        imported=imported,
-        failed=failed,
-        rows=rows,
-    )
+    yield ImportResult(dry_run=dry_run, imported=imported, failed=failed)
@@ -1,20 +1,36 @@
 from __future__ import annotations
 
+import itertools
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import List
 
+from cachetools import TTLCache
 from fastapi import Depends, FastAPI, File, HTTPException, UploadFile
-from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import SQLAlchemyError
 
-from . import importer, models, schemas, serials
-from .database import Base, engine, get_db
+from . import importer, migrations, models, schemas, serials
+from .database import Base, SessionLocal, engine, get_db
 
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Coastal Waves Inventory API")
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migrations.backfill_variant_short_codes)
+        await conn.run_sync(migrations.create_transaction_location_type_index)
+    yield
+    await engine.dispose()
+
+
+app = FastAPI(title="Coastal Waves Inventory API", lifespan=lifespan)
 
 FRONTEND_DIR = Path(__file__).resolve().parents[2] / "frontend"
 if FRONTEND_DIR.exists():
@@ -22,14 +38,34 @@ if FRONTEND_DIR.exists():
 else:
     FRONTEND_DIR = None
 
+# Report aggregates are cached briefly so a polling dashboard does not rescan the
+# inventory/transaction tables on every request; writes clear the cache.
+_REPORT_CACHE: TTLCache = TTLCache(maxsize=16, ttl=5)
+
+# Import rows are parsed on the threadpool and streamed back this many at a time.
+IMPORT_STREAM_CHUNK_SIZE = 500
+
+
+def _get_cached_report(key: str):
+    return _REPORT_CACHE.get(key)
+
+
+def _store_cached_report(key: str, value):
+    _REPORT_CACHE[key] = value
+    return value
+
+
+def _clear_report_cache() -> None:
+    _REPORT_CACHE.clear()
+
 
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
 
 @app.get("/")
-def desktop_index():
+async def desktop_index():
     if not FRONTEND_DIR:
         raise HTTPException(status_code=503, detail="Frontend bundle missing")
     index_path = FRONTEND_DIR / "index.html"
@@ -38,109 +74,110 @@ def desktop_index():
 
 # Painting endpoints
 @app.post("/paintings", response_model=schemas.PaintingRead)
-def create_painting(painting: schemas.PaintingCreate, db: Session = Depends(get_db)):
-    existing = db.query(models.Painting).filter_by(code=painting.code).first()
+async def create_painting(painting: schemas.PaintingCreate, db: AsyncSession = Depends(get_db)):
+    existing = (await db.execute(select(models.Painting).filter_by(code=painting.code))).scalar_one_or_none()
     if existing:
         raise HTTPException(status_code=400, detail="Painting code already exists")
     record = models.Painting(**painting.model_dump())
     db.add(record)
-    db.commit()
-    db.refresh(record)
+    await db.commit()
+    await db.refresh(record)
     return record
 
 
 @app.get("/paintings", response_model=List[schemas.PaintingRead])
-def list_paintings(db: Session = Depends(get_db)):
-    return db.query(models.Painting).all()
+async def list_paintings(db: AsyncSession = Depends(get_db)):
+    return (await db.scalars(select(models.Painting))).all()
 
 
 @app.get("/paintings/{painting_id}", response_model=schemas.PaintingRead)
-def get_painting(painting_id: int, db: Session = Depends(get_db)):
-    record = db.query(models.Painting).get(painting_id)
+async def get_painting(painting_id: int, db: AsyncSession = Depends(get_db)):
+    record = await db.get(models.Painting, painting_id)
     if not record:
         raise HTTPException(status_code=404, detail="Painting not found")
     return record
 
 
 @app.delete("/paintings/{painting_id}")
-def delete_painting(painting_id: int, db: Session = Depends(get_db)):
-    record = db.query(models.Painting).get(painting_id)
+async def delete_painting(painting_id: int, db: AsyncSession = Depends(get_db)):
+    record = await db.get(models.Painting, painting_id)
     if not record:
         raise HTTPException(status_code=404, detail="Painting not found")
-    db.delete(record)
-    db.commit()
+    await db.delete(record)
+    await db.commit()
     return {"status": "deleted"}
 
 
 # Variant endpoints
 @app.post("/variants", response_model=schemas.VariantRead)
-def create_variant(variant: schemas.VariantCreate, db: Session = Depends(get_db)):
-    painting = db.query(models.Painting).get(variant.painting_id)
+async def create_variant(variant: schemas.VariantCreate, db: AsyncSession = Depends(get_db)):
+    painting = await db.get(models.Painting, variant.painting_id)
     if not painting:
         raise HTTPException(status_code=404, detail="Painting not found")
     existing = (
-        db.query(models.ProductVariant)
-        .filter_by(
-            painting_id=variant.painting_id,
-            category=variant.category,
-            size=variant.size,
-            stretch=variant.stretch,
-            framing=variant.framing,
+        await db.execute(
+            select(models.ProductVariant).filter_by(
+                painting_id=variant.painting_id,
+                category=variant.category,
+                size=variant.size,
+                stretch=variant.stretch,
+                framing=variant.framing,
+            )
         )
-        .first()
-    )
+    ).scalar_one_or_none()
     if existing:
         raise HTTPException(status_code=400, detail="Variant already exists for painting")
-    record = models.ProductVariant(**variant.model_dump())
+    short_code = serials.build_variant_code(variant.category, variant.size, variant.stretch, variant.framing)
+    record = models.ProductVariant(short_code=short_code, **variant.model_dump())
     db.add(record)
-    db.commit()
-    db.refresh(record)
-    short_code = serials.build_variant_code(record.category, record.size, record.stretch, record.framing)
-    return schemas.VariantRead(short_code=short_code, **record.__dict__)
+    await db.commit()
+    await db.refresh(record)
+    return record
 
 
 @app.get("/variants", response_model=List[schemas.VariantRead])
-def list_variants(db: Session = Depends(get_db)):
-    variants = db.query(models.ProductVariant).all()
-    result = []
-    for variant in variants:
-        short_code = serials.build_variant_code(variant.category, variant.size, variant.stretch, variant.framing)
-        result.append(schemas.VariantRead(short_code=short_code, **variant.__dict__))
-    return result
+async def list_variants(db: AsyncSession = Depends(get_db)):
+    # VariantRead carries painting_id only, so the painting relationship is left unloaded.
+    return (await db.scalars(select(models.ProductVariant))).all()
 
 
 # Location endpoints
 @app.post("/locations", response_model=schemas.LocationRead)
-def create_location(location: schemas.LocationCreate, db: Session = Depends(get_db)):
-    existing = db.query(models.Location).filter(
-        (models.Location.name == location.name) | (models.Location.code == location.code)
+async def create_location(location: schemas.LocationCreate, db: AsyncSession = Depends(get_db)):
+    existing = (
+        await db.scalars(
+            select(models.Location).where(
+                (models.Location.name == location.name) | (models.Location.code == location.code)
+            )
+        )
     ).first()
     if existing:
         raise HTTPException(status_code=400, detail="Location name or code already exists")
     record = models.Location(**location.model_dump())
     db.add(record)
-    db.commit()
-    db.refresh(record)
+    await db.commit()
+    await db.refresh(record)
     return record
 
 
 @app.get("/locations", response_model=List[schemas.LocationRead])
-def list_locations(db: Session = Depends(get_db)):
-    return db.query(models.Location).all()
+async def list_locations(db: AsyncSession = Depends(get_db)):
+    return (await db.scalars(select(models.Location))).all()
 
 
 # Inventory endpoints
 @app.post("/inventory", response_model=schemas.InventoryRead)
-def create_inventory_item(item: schemas.InventoryCreate, db: Session = Depends(get_db)):
-    painting = db.query(models.Painting).get(item.painting_id)
-    variant = db.query(models.ProductVariant).get(item.variant_id)
-    location = db.query(models.Location).get(item.location_id)
+async def create_inventory_item(item: schemas.InventoryCreate, db: AsyncSession = Depends(get_db)):
+    painting = await db.get(models.Painting, item.painting_id)
+    variant = await db.get(models.ProductVariant, item.variant_id)
+    location = await db.get(models.Location, item.location_id)
     if not painting or not variant or not location:
         raise HTTPException(status_code=400, detail="Painting, variant, or location not found")
 
+    item.serial_number = item.serial_number.strip()
     expected_serial = serials.SerialComponents(
         painting_code=painting.code.upper(),
-        variant_code=serials.build_variant_code(variant.category, variant.size, variant.stretch, variant.framing),
+        variant_code=variant.short_code,
         location_code=location.code.upper(),
         sequence=serials.parse_serial_number(item.serial_number).sequence,
     )
@@ -149,10 +186,10 @@ def create_inventory_item(item: schemas.InventoryCreate, db: Session = Depends(g
     except ValueError as exc:  # pragma: no cover - FastAPI handles
         raise HTTPException(status_code=400, detail=str(exc))
 
-    existing_count = (
-        db.query(models.InventoryItem)
-        .filter(models.InventoryItem.serial_number.like(f"PTG-{painting.code.upper()}-%"))
-        .count()
+    existing_count = await db.scalar(
+        select(func.count())
+        .select_from(models.InventoryItem)
+        .where(models.InventoryItem.serial_number.like(f"PTG-{painting.code.upper()}-%"))
     )
     parsed = serials.parse_serial_number(item.serial_number)
     if parsed.sequence == "0000":
@@ -161,41 +198,50 @@ def create_inventory_item(item: schemas.InventoryCreate, db: Session = Depends(g
 
     record = models.InventoryItem(**item.model_dump())
     db.add(record)
-    db.commit()
-    db.refresh(record)
+    await db.commit()
+    await db.refresh(record)
+    _clear_report_cache()
     return record
 
 
 @app.get("/inventory", response_model=List[schemas.InventoryRead])
-def list_inventory(db: Session = Depends(get_db)):
-    return db.query(models.InventoryItem).all()
+async def list_inventory(db: AsyncSession = Depends(get_db)):
+    # InventoryRead carries foreign key ids only, so no relationships are loaded.
+    return (await db.scalars(select(models.InventoryItem))).all()
 
 
 # Transaction endpoints
 @app.post("/transactions", response_model=schemas.TransactionRead)
-def create_transaction(transaction: schemas.TransactionCreate, db: Session = Depends(get_db)):
-    item = db.query(models.InventoryItem).get(transaction.inventory_item_id)
-    location = db.query(models.Location).get(transaction.location_id)
+async def create_transaction(transaction: schemas.TransactionCreate, db: AsyncSession = Depends(get_db)):
+    item = await db.get(models.InventoryItem, transaction.inventory_item_id)
+    location = await db.get(models.Location, transaction.location_id)
     if not item or not location:
         raise HTTPException(status_code=400, detail="Inventory item or location not found")
 
     record = models.Transaction(**transaction.model_dump())
     db.add(record)
-    db.commit()
-    db.refresh(record)
+    await db.commit()
+    await db.refresh(record)
+    _clear_report_cache()
     return record
 
 
 @app.get("/transactions", response_model=List[schemas.TransactionRead])
-def list_transactions(db: Session = Depends(get_db)):
-    return db.query(models.Transaction).order_by(models.Transaction.created_at.desc()).all()
+async def list_transactions(db: AsyncSession = Depends(get_db)):
+    transactions = await db.scalars(
+        select(models.Transaction).order_by(models.Transaction.created_at.desc())
+    )
+    return transactions.all()
 
 
 # Aggregate endpoints
 @app.get("/reports/stock", response_model=List[schemas.LocationStockSummary])
-def stock_by_location(db: Session = Depends(get_db)):
-    rows = (
-        db.query(
+async def stock_by_location(db: AsyncSession = Depends(get_db)):
+    cached = _get_cached_report("stock")
+    if cached is not None:
+        return cached
+    rows = await db.execute(
+        select(
             models.Location.id.label("location_id"),
             models.Location.name.label("location_name"),
             models.Location.is_home,
@@ -203,67 +249,135 @@ def stock_by_location(db: Session = Depends(get_db)):
         )
         .join(models.InventoryItem, models.Location.id == models.InventoryItem.location_id)
         .group_by(models.Location.id)
-        .all()
     )
-    return [schemas.LocationStockSummary(**row._asdict()) for row in rows]
+    return _store_cached_report("stock", [schemas.LocationStockSummary(**row._asdict()) for row in rows])
 
 
 @app.get("/reports/sales", response_model=List[schemas.LocationSalesSummary])
-def sales_by_location(db: Session = Depends(get_db)):
-    rows = (
-        db.query(
+async def sales_by_location(db: AsyncSession = Depends(get_db)):
+    cached = _get_cached_report("sales")
+    if cached is not None:
+        return cached
+    rows = await db.execute(
+        select(
             models.Location.id.label("location_id"),
             models.Location.name.label("location_name"),
             models.Location.is_home,
             func.sum(models.Transaction.quantity).label("sold"),
             func.sum(models.Transaction.total_price).label("revenue"),
         )
+        .select_from(models.Transaction)
         .join(models.Location, models.Transaction.location_id == models.Location.id)
-        .filter(models.Transaction.type == "sale")
+        .where(models.Transaction.type == "sale")
         .group_by(models.Location.id)
-        .all()
     )
-    return [schemas.LocationSalesSummary(**row._asdict()) for row in rows]
+    return _store_cached_report("sales", [schemas.LocationSalesSummary(**row._asdict()) for row in rows])
 
 
 @app.get("/reports/home", response_model=dict)
-def home_grouping(db: Session = Depends(get_db)):
-    home_locations = db.query(models.Location).filter(models.Location.is_home.is_(True)).all()
-    home_ids = [loc.id for loc in home_locations]
-    on_hand = (
-        db.query(func.sum(models.InventoryItem.quantity))
-        .filter(models.InventoryItem.location_id.in_(home_ids))
-        .scalar()
-        or 0
+async def home_grouping(db: AsyncSession = Depends(get_db)):
+    cached = _get_cached_report("home")
+    if cached is not None:
+        return cached
+    home_ids = select(models.Location.id).where(models.Location.is_home.is_(True))
+    on_hand_total = (
+        select(func.coalesce(func.sum(models.InventoryItem.quantity), 0))
+        .where(models.InventoryItem.location_id.in_(home_ids))
+        .scalar_subquery()
     )
-    sold = (
-        db.query(func.sum(models.Transaction.quantity))
-        .filter(models.Transaction.location_id.in_(home_ids), models.Transaction.type == "sale")
-        .scalar()
-        or 0
+    sales = (
+        select(
+            func.coalesce(func.sum(models.Transaction.quantity), 0).label("sold"),
+            func.coalesce(func.sum(models.Transaction.total_price), 0.0).label("revenue"),
+        )
+        .where(models.Transaction.location_id.in_(home_ids), models.Transaction.type == "sale")
+        .subquery()
     )
-    revenue = (
-        db.query(func.sum(models.Transaction.total_price))
-        .filter(models.Transaction.location_id.in_(home_ids), models.Transaction.type == "sale")
-        .scalar()
-        or 0.0
+    result = await db.execute(select(on_hand_total, sales.c.sold, sales.c.revenue))
+    on_hand, sold, revenue = result.one()
+    return _store_cached_report("home", {"on_hand": int(on_hand), "sold": int(sold), "revenue": float(revenue)})
+
+
+async def _stream_import(rows, upload, dry_run: bool):
+    # Records are only written once the last row has been produced, so no transaction is held open
+    # while the client reads the body. A database error or a sheet that breaks partway through leaves
+    # nothing saved, and the summary line reports it.
+    records: List[dict] = []
+    result = None
+    failed = 0
+    try:
+        while True:
+            # Rows are pulled from the threadpool in chunks; a hop per row costs about as much as parsing it.
+            chunk, read_error = await run_in_threadpool(_take_import_rows, rows, IMPORT_STREAM_CHUNK_SIZE)
+            lines = []
+            for item in chunk:
+                if isinstance(item, importer.ImportResult):
+                    result = item
+                    continue
+                lines.append(schemas.ImportRow.model_validate(item, from_attributes=True).model_dump_json())
+                if item.errors:
+                    failed += 1
+                if item.record is not None:
+                    records.append(item.record)
+            if lines:
+                yield "\n".join(lines) + "\n"
+            if read_error is not None or not chunk:
+                break
+    finally:
+        upload.close()
+    error = None
+    if read_error is not None:
+        error = f"Import aborted, no rows were saved: workbook could not be read ({read_error})"
+    elif not dry_run:
+        # The request's session is closed before a streamed body runs, so the insert uses its own.
+        async with SessionLocal() as session:
+            try:
+                if records:
+                    await session.execute(insert(models.InventoryItem), records)
+                await session.commit()
+            except SQLAlchemyError as exc:
+                await session.rollback()
+                error = _import_error(exc)
+            else:
+                _clear_report_cache()
+    summary = schemas.ImportResult(
+        dry_run=dry_run,
+        imported=0 if error else result.imported,
+        failed=result.failed if result else failed,
+        error=error,
     )
-    return {"on_hand": int(on_hand), "sold": int(sold), "revenue": float(revenue)}
+    yield summary.model_dump_json() + "\n"
+
 
+def _take_import_rows(rows, size: int):
+    # openpyxl parses the sheet lazily, so a corrupt worksheet can raise on any row, not just at open.
+    chunk = []
+    try:
+        for item in itertools.islice(rows, size):
+            chunk.append(item)
+    except Exception as exc:
+        return chunk, exc
+    return chunk, None
+
+
+def _import_error(exc: SQLAlchemyError) -> str:
+    return f"Import rolled back, no rows were saved: {getattr(exc, 'orig', None) or exc}"
 
-@app.post("/import/inventory", response_model=schemas.ImportResult)
-def import_inventory(
-    file: UploadFile = File(...), dry_run: bool = True, db: Session = Depends(get_db)
+
+@app.post("/import/inventory")
+async def import_inventory(
+    file: UploadFile = File(...), dry_run: bool = True, db: AsyncSession = Depends(get_db)
 ):
+    # FastAPI closes the UploadFile once this handler returns, so the stream reads its own copy.
+    upload = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    await file.seek(0)
+    await run_in_threadpool(shutil.copyfileobj, file.file, upload)
+    upload.seek(0)
+    lookups = await importer.load_import_lookups(db)
     try:
-        file.file.seek(0)
-        result = importer.process_inventory_upload(file.file, db, dry_run)
+        # Opening the workbook validates it, so a bad upload is still rejected before streaming starts.
+        rows = await run_in_threadpool(importer.process_inventory_upload, upload, lookups, dry_run)
     except ValueError as exc:  # pragma: no cover - FastAPI handles
+        upload.close()
         raise HTTPException(status_code=400, detail=str(exc))
-
-    return schemas.ImportResult(
-        dry_run=result.dry_run,
-        imported=result.imported,
-        failed=result.failed,
-        rows=[schemas.ImportRow(**row.__dict__) for row in result.rows],
-    )
+    return StreamingResponse(_stream_import(rows, upload, dry_run), media_type="application/x-ndjson")
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from sqlalchemy import bindparam, inspect, select, text, update
+
+from . import models, serials
+
+
+def backfill_variant_short_codes(conn) -> None:
+    # Databases created before ProductVariant.short_code existed get the column added and filled in place.
+    columns = {column["name"] for column in inspect(conn).get_columns("product_variants")}
+    if "short_code" in columns:
+        return
+    variants = models.ProductVariant.__table__
+    conn.execute(text("ALTER TABLE product_variants ADD COLUMN short_code VARCHAR(12) NOT NULL DEFAULT ''"))
+    rows = conn.execute(
+        select(variants.c.id, variants.c.category, variants.c.size, variants.c.stretch, variants.c.framing)
+    ).all()
+    if rows:
+        conn.execute(
+            update(variants).where(variants.c.id == bindparam("variant_id")).values(short_code=bindparam("code")),
+            [
+                {
+                    "variant_id": row.id,
+                    "code": serials.build_variant_code(row.category, row.size, row.stretch, row.framing),
+                }
+                for row in rows
+            ],
+        )
+    conn.execute(text("CREATE INDEX ix_product_variants_short_code ON product_variants (short_code)"))
+
+
+def create_transaction_location_type_index(conn) -> None:
+    # create_all skips indexes on tables that already exist, so older databases get this one here.
+    conn.execute(
+        text("CREATE INDEX IF NOT EXISTS ix_transactions_location_type ON transactions (location_id, type)")
+    )
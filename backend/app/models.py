@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, String, UniqueConstraint
+from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, String, UniqueConstraint
 from sqlalchemy.orm import relationship
 
 from .database import Base
@@ -11,7 +11,7 @@ class Painting(Base):
     __tablename__ = "paintings"
 
     id = Column(Integer, primary_key=True, index=True)
-    code = Column(String(50), unique=True, nullable=False)
+    code = Column(String(50), unique=True, index=True, nullable=False)
     name = Column(String(255), nullable=False)
     variants = relationship("ProductVariant", back_populates="painting", cascade="all, delete-orphan")
 
@@ -28,6 +28,7 @@ class ProductVariant(Base):
     size = Column(String(50), nullable=False)
     stretch = Column(Boolean, default=False, nullable=False)
     framing = Column(Boolean, default=False, nullable=False)
+    short_code = Column(String(12), nullable=False, index=True)
 
     painting = relationship("Painting", back_populates="variants")
     inventory_items = relationship("InventoryItem", back_populates="variant")
@@ -39,7 +40,7 @@ class Location(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), unique=True, nullable=False)
     is_home = Column(Boolean, default=False, nullable=False)
-    code = Column(String(12), unique=True, nullable=False)
+    code = Column(String(12), unique=True, index=True, nullable=False)
 
     inventory_items = relationship("InventoryItem", back_populates="location")
     transactions = relationship("Transaction", back_populates="location")
@@ -67,6 +68,9 @@ class InventoryItem(Base):
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_location_type", "location_id", "type"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     inventory_item_id = Column(Integer, ForeignKey("inventory_items.id"), nullable=False)
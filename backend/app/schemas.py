@@ -132,4 +132,4 @@ class ImportResult(BaseModel):
     dry_run: bool
     imported: int
     failed: int
-    rows: List[ImportRow]
+    error: Optional[str] = None
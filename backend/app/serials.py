@@ -2,16 +2,18 @@ from __future__ import annotations
 
 import re
 from dataclasses import dataclass
+from functools import lru_cache
 
 SERIAL_PATTERN = re.compile(
-    r"^PTG-(?P<painting>[A-Z0-9]{2,10})-"  # painting code
+    r"PTG-(?P<painting>[A-Z0-9]{2,10})-"  # painting code
     r"(?P<variant>[A-Z0-9]{2,12})-"  # variant short code
     r"(?P<location>[A-Z0-9]{2,8})-"  # location code
-    r"(?P<sequence>\d{4})$"
+    r"(?P<sequence>\d{4})"
 )
+_NON_ALNUM = re.compile(r"[^A-Z0-9]")
 
 
-@dataclass
+@dataclass(frozen=True)
 class SerialComponents:
     painting_code: str
     variant_code: str
@@ -23,8 +25,27 @@ class SerialComponents:
         return f"PTG-{self.painting_code}-{self.variant_code}-{self.location_code}-{self.sequence}"
 
 
+def _is_code(part: str, max_length: int) -> bool:
+    return 2 <= len(part) <= max_length and part.isascii() and part.isalnum() and part == part.upper()
+
+
+@lru_cache(maxsize=4096)
 def parse_serial_number(serial_number: str) -> SerialComponents:
-    match = SERIAL_PATTERN.match(serial_number.strip())
+    # Callers are expected to pass an already stripped serial number.
+    # Well-formed serials are split directly; the regex only runs for inputs the fast path rejects.
+    parts = serial_number.split("-")
+    if (
+        len(parts) == 5
+        and parts[0] == "PTG"
+        and _is_code(parts[1], 10)
+        and _is_code(parts[2], 12)
+        and _is_code(parts[3], 8)
+        and len(parts[4]) == 4
+        and parts[4].isascii()
+        and parts[4].isdigit()
+    ):
+        return SerialComponents(*parts[1:])
+    match = SERIAL_PATTERN.fullmatch(serial_number)
     if not match:
         raise ValueError(
             "Serial number must follow PTG-<PAINTING>-<VARIANT>-<LOCATION>-<SEQUENCE> with codes in uppercase."
@@ -37,9 +58,19 @@ def parse_serial_number(serial_number: str) -> SerialComponents:
     )
 
 
+def _code_part(value: str) -> str:
+    # Most inputs ("CANVAS", "16X20") need no filtering, so only fall back to the regex when the prefix is dirty.
+    upper = value.upper()
+    prefix = upper[:4]
+    if prefix.isascii() and prefix.isalnum():
+        return prefix
+    return _NON_ALNUM.sub("", upper)[:4]
+
+
+@lru_cache(maxsize=None)
 def build_variant_code(category: str, size: str, stretch: bool, framing: bool) -> str:
-    category_part = re.sub(r"[^A-Z0-9]", "", category.upper())[:4]
-    size_part = re.sub(r"[^A-Z0-9]", "", size.upper())[:4]
+    category_part = _code_part(category)
+    size_part = _code_part(size)
     stretch_part = "S" if stretch else "N"
     frame_part = "F" if framing else "N"
     code = f"{category_part}{size_part}{stretch_part}{frame_part}"
@@ -47,11 +47,13 @@ def _run_api():
 
 
 def _wait_for_api(timeout: float = 10.0) -> bool:
-    start = time.time()
-    while time.time() - start < timeout:
+    deadline = time.monotonic() + timeout
+    delay = 0.025
+    while time.monotonic() < deadline:
         if _api_is_reachable(API_HOST, API_PORT):
             return True
-        time.sleep(0.2)
+        time.sleep(delay)
+        delay = min(delay * 1.5, 0.1)
     return False
 
 